@@ -47,6 +47,9 @@ setup(
     extras_require={
         "optimize": [
             "minify-html",
+            "markdown-it-pyrs",
+            "orjson",
+            "lmdb",
         ],
         "integration": [
             "psutil",
@@ -109,6 +109,8 @@ def run_build(ns):
         eager=ns.eager,
         memprofile_directory=ns.memprofile_directory,
         include_external_links=ns.include_external_links,
+        minify=ns.minify,
+        storytext_cache_directory=ns.storytext_cache_directory,
         skip_stories=ns.skip_stories,
     )
     builder.build(ns.outpath, options=build_options)
@@ -300,6 +302,18 @@ def main():
         dest="include_external_links",
         help="do not include external links to the works",
     )
+    build_parser.add_argument(
+        "--no-minify",
+        action="store_false",
+        dest="minify",
+        help="do not minify the html pages, which is faster but increases the ZIM size",
+    )
+    build_parser.add_argument(
+        "--storytext-cache-directory",
+        action="store",
+        default=None,
+        help="cache rendered storytexts in this directory, speeding up later builds (requires lmdb)",
+    )
     build_parser.add_argument(
         "--debug-skip-stories",
         action="store_true",
@@ -5,6 +5,12 @@ from sqlalchemy import create_engine, event
 from sqlalchemy.engine import Engine
 
 
+# size of the memory map used by sqlite connections (in bytes)
+SQLITE_MMAP_SIZE = 1024 * 1024 * 1024
+# size of the page cache of sqlite connections (in KiB)
+SQLITE_CACHE_SIZE = 64 * 1024
+
+
 def enable_foreign_keys(dbapi_conn):
     """
     Enable foreign key constraints for this connection.
@@ -17,10 +23,28 @@ def enable_foreign_keys(dbapi_conn):
     cursor.close()
 
 
+def tune_sqlite_connection(dbapi_conn):
+    """
+    Configure a sqlite connection for faster reading.
+
+    This memory maps the database, so that multiple processes reading
+    it share the pages of the OS cache, and increases the page cache
+    of the connection. Both settings only apply to this connection and
+    do not modify the database file.
+
+    @param dbapi_conn: database connection
+    @type dbapi_conn: L{sqlalchemy.engine.interfaces.DBAPIConnection}
+    """
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA mmap_size={}".format(SQLITE_MMAP_SIZE))
+    cursor.execute("PRAGMA cache_size=-{}".format(SQLITE_CACHE_SIZE))
+    cursor.close()
+
+
 @event.listens_for(Engine, "connect")
 def enable_foreign_keys_on_connect(dbapi_connection, connection_record):
     """
-    Enable foreign keys if a sqlite connection has been made.
+    Enable foreign keys and tune the connection if a sqlite connection has been made.
 
     @param dbapi_conn: database connection
     @type dbapi_conn: L{sqlalchemy.engine.interfaces.DBAPIConnection}
@@ -30,6 +54,7 @@ def enable_foreign_keys_on_connect(dbapi_connection, connection_record):
     # Check if the connection URL is SQLite
     if "sqlite" in str(connection_record.driver_connection):
         enable_foreign_keys(dbapi_connection)
+        tune_sqlite_connection(dbapi_connection)
 
 
 class ConnectionConfig(object):
@@ -13,13 +13,19 @@ tags that can be written in different ways such that the same tag is
 always written the same way.
 """
 
+import functools
+
 # ALLOWED_TAG_LETTERS = re.compile(r"[^\w\.\(\)|\!\?\-]")
 
 
+@functools.lru_cache(maxsize=65536)
 def normalize_tag(tag):
     """
     Normalize a tag so it works in URLs.
 
+    As the same tags are normalized over and over again during a build,
+    the results are cached.
+
     @param tag: tag to normalize
     @type tag: L{str}
     @return: the normalized tag
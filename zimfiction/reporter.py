@@ -185,18 +185,24 @@ class StdoutProgressReporter(BaseProgressReporter):
 
     @cvar BAR_LENGTH: length of progress bar to print
     @type BAR_LENGTH: L{int}
+    @cvar MIN_REDRAW_INTERVAL: min number of seconds between redraws when advancing
+    @type MIN_REDRAW_INTERVAL: L{float}
     """
 
     BAR_LENGTH = 20
     DRAW_UNITS = True
+    MIN_REDRAW_INTERVAL = 0.1
 
     def __init__(self, *args, **kwargs):
         BaseProgressReporter.__init__(self, *args, **kwargs)
+        self._last_draw_time = 0.0
         self.print_progress()
 
     def advance(self, steps, secondary=0):
         BaseProgressReporter.advance(self, steps, secondary=secondary)
-        self.print_progress()
+        # terminal writes are expensive, only redraw every now and then
+        if time.monotonic() - self._last_draw_time >= self.MIN_REDRAW_INTERVAL:
+            self.print_progress()
 
     def _get_bar(self, progress, error=False):
         """
@@ -259,6 +265,7 @@ class StdoutProgressReporter(BaseProgressReporter):
         if unit_str:
             unit_str = "({})".format(unit_str)
         print("\33[2K{} {} {} {} ".format(self.description, bar, eta_string, unit_str), end="\r")
+        self._last_draw_time = time.monotonic()
 
     def finish(self, error=False):
         if error:
@@ -9,6 +9,10 @@ from .db.models import Story, Chapter, StoryTagAssociation, StoryCategoryAssocia
 from sqlalchemy import select, func, literal_column, true
 
 
+# number of timeline rows to fetch at once when evaluating story list stats
+TIMELINE_YIELD = 10000
+
+
 def zerodiv(a, b):
     """
     Calculate a/b if b != 0 else return 0.
@@ -25,6 +29,24 @@ def zerodiv(a, b):
     return a/b
 
 
+def _int_or_default(value, default=None):
+    """
+    Convert the result of an SQL aggregate function to an int.
+
+    Aggregates like SUM() or MIN() return NULL when no row matched.
+
+    @param value: value to convert
+    @type value: L{int}, L{decimal.Decimal} or L{None}
+    @param default: value to return if value is None
+    @type default: L{int} or L{None}
+    @return: the converted value or the default
+    @rtype: L{int} or L{None}
+    """
+    if value is None:
+        return default
+    return int(value)
+
+
 class Counter(object):
     """
     A simple class for incrementally counting the number of objects seen.
@@ -678,16 +700,18 @@ def query_story_list_stats(session, select_story_statement=None):
     result = session.execute(stats_stmt).one()
     kwargs = {
         "story_count": int(result.story_count),
-        "total_words": int(result.total_words),
-        "min_story_words": int(result.min_words),
-        "max_story_words": int(result.max_words),
+        # no story in the list may have chapters, in which case these
+        # behave like the counters of StoryListStatCreator
+        "total_words": _int_or_default(result.total_words, 0),
+        "min_story_words": _int_or_default(result.min_words),
+        "max_story_words": _int_or_default(result.max_words),
 
-        "chapter_count": int(result.chapter_count),
-        "min_chapter_count": int(result.min_chapter_count),
-        "max_chapter_count": int(result.max_chapter_count),
+        "chapter_count": _int_or_default(result.chapter_count, 0),
+        "min_chapter_count": _int_or_default(result.min_chapter_count),
+        "max_chapter_count": _int_or_default(result.max_chapter_count),
 
-        "min_chapter_words": int(result.min_chapter_words),
-        "max_chapter_words": int(result.max_chapter_words),
+        "min_chapter_words": _int_or_default(result.min_chapter_words),
+        "max_chapter_words": _int_or_default(result.max_chapter_words),
 
         "author_count": int(result.author_count),
         "total_author_count": int(result.total_author_count),
@@ -749,6 +773,7 @@ def query_story_list_stats(session, select_story_statement=None):
             Story.updated,
         )
         .where(story_condition)
+        .execution_options(yield_per=TIMELINE_YIELD)
     )
     result = session.execute(timeline_stmt)
     for story in result:
@@ -762,7 +787,7 @@ def query_story_list_stats(session, select_story_statement=None):
             "average_date_published": published_counter.average,
 
             "min_date_updated": updated_counter.min,
-            "max_date_updated": updated_counter.min,
+            "max_date_updated": updated_counter.max,
             "average_date_updated": updated_counter.average,
             "timeline": timeline_data,
         }
@@ -7,6 +7,7 @@ Various utility functions.
 import datetime
 import re
 import os
+import itertools
 
 
 ALLOWED_WORD_LETTERS = re.compile(r"[^\w|\-]")
@@ -73,7 +74,8 @@ def format_date(date):
     @return: the formated date
     @rtype: L{str}
     """
-    return date.strftime("%Y-%m-%d")
+    # equivalent to date.strftime("%Y-%m-%d"), but avoids the overhead of strftime
+    return "{:04d}-{:02d}-{:02d}".format(date.year, date.month, date.day)
 
 
 def get_package_dir():
@@ -270,13 +272,12 @@ def chunked(iterable, n):
     @return: a generator yielding lists, each a chunk of the input data
     @rtype: generator yielding L{list}
     """
-    current = []
-    for element in iterable:
-        current.append(element)
-        if len(current) >= n:
-            yield current
-            current = []
-    if current:
+    # islice() collects the elements of each chunk in C
+    iterator = iter(iterable)
+    while True:
+        current = list(itertools.islice(iterator, n))
+        if not current:
+            return
         yield current
 
 
@@ -26,7 +26,7 @@ import pathlib
 from scss.compiler import Compiler as ScssCompiler
 from scss.namespace import Namespace as ScssNamespace
 from scss.types import String as ScssString
-from sqlalchemy import select, func, distinct
+from sqlalchemy import select, func, distinct, case
 from sqlalchemy.orm import Session
 from libzim.writer import Creator, Item, StringProvider, FileProvider, Hint
 
@@ -45,7 +45,7 @@ from ..db.models import Story, Author, Series, Publisher, StoryTagAssociation, S
 from ..db.unique import set_unique_enabled
 from ..implication.implicationlevel import ImplicationLevel
 from ..reporter import StdoutReporter
-from .renderer import HtmlPage, Redirect, JsonObject, Script, RenderOptions
+from .renderer import HtmlPage, Redirect, JsonObject, Script, RenderOptions, HtmlRenderer
 from .worker import Worker, WorkerOptions, StopTask, StoryRenderTask
 from .worker import TagRenderTask, AuthorRenderTask, CategoryRenderTask
 from .worker import SeriesRenderTask, PublisherRenderTask, EtcRenderTask
@@ -159,7 +159,7 @@ class HtmlPageItem(Item):
         @param title: title of the page
         @type title: L{str}
         @param content: the content of the page
-        @type content: L{str}
+        @type content: L{str} or L{bytes}
         @param is_front: if this is nonzero, set this as a front article
         @type is_front: L{bool}
         """
@@ -201,7 +201,7 @@ class JsonItem(Item):
         @param title: title of the json file
         @type title: L{str}
         @param content: the content of the json file
-        @type content: L{str}
+        @type content: L{str} or L{bytes}
         """
         super().__init__()
         self._path = path
@@ -376,6 +376,10 @@ class BuildOptions(object):
 
     @ivar include_external_links: whether the ZIM should contain external links or not
     @type include_external_links: L{bool}
+    @ivar minify: whether the html pages should be minified
+    @type minify: L{bool}
+    @ivar storytext_cache_directory: if not None, cache rendered storytexts in this directory
+    @type storytext_cache_directory: L{str} or L{None}
 
     @ivar skip_stories: debug option to not render stories
     @type skip_stories: L{bool}
@@ -405,6 +409,8 @@ class BuildOptions(object):
 
         # render options
         include_external_links=False,
+        minify=True,
+        storytext_cache_directory=None,
 
         # debug options
         skip_stories=False,
@@ -442,6 +448,10 @@ class BuildOptions(object):
 
         @param include_external_links: whether the ZIM should contain external links or not
         @type include_external_links: L{bool}
+        @param minify: whether the html pages should be minified
+        @type minify: L{bool}
+        @param storytext_cache_directory: if specified, cache rendered storytexts in this directory
+        @type storytext_cache_directory: L{str} or L{None}
 
         @param skip_stories: debug option to not render stories
         @type skip_stories: L{bool}
@@ -466,6 +476,8 @@ class BuildOptions(object):
         self.memprofile_directory = memprofile_directory
 
         self.include_external_links = include_external_links
+        self.minify = minify
+        self.storytext_cache_directory = storytext_cache_directory
 
         self.skip_stories = skip_stories
 
@@ -521,6 +533,8 @@ class BuildOptions(object):
         """
         options = RenderOptions(
             include_external_links=self.include_external_links,
+            minify=self.minify,
+            storytext_cache_directory=self.storytext_cache_directory,
         )
         return options
 
@@ -855,6 +869,17 @@ class ZimBuilder(object):
         worker_options = options.get_worker_options()
         render_options = options.get_render_options()
 
+        # threads and forked processes can share a single renderer,
+        # which saves each worker from compiling the templates itself.
+        # Other processes load the templates from the bytecode cache,
+        # which is populated here once before they are started
+        if options.use_threads or (multiprocessing.get_start_method() == "fork"):
+            renderer = HtmlRenderer(options=render_options)
+            renderer.preload_templates()
+        else:
+            renderer = None
+            HtmlRenderer(options=render_options).preload_templates()
+
         # start workers
         self.reporter.msg("     -> Starting workers... ", end="")
         workers = []
@@ -869,6 +894,7 @@ class ZimBuilder(object):
                     "connection_config": self.connection_config,
                     "worker_options": worker_options,
                     "render_options": render_options,
+                    "renderer": renderer,
                 },
             )
             worker.daemon = True
@@ -960,7 +986,7 @@ class ZimBuilder(object):
                     bar.advance(task_multiplier)
                 else:
                     # add the rendered objects to the ZIM
-                    for rendered_object in render_result.iter_objects():
+                    for rendered_object in render_result.objects:
                         if isinstance(rendered_object, HtmlPage):
                             # add a HTML page
                             item = HtmlPageItem(
@@ -1006,7 +1032,7 @@ class ZimBuilder(object):
                         set_or_increment(self.num_files_added, "total")
                         bar.advance(0, secondary=1)
 
-    def _worker_process(self, id, connection_config, worker_options, render_options):
+    def _worker_process(self, id, connection_config, worker_options, render_options, renderer=None):
         """
         This method will be executed as a worker process.
 
@@ -1021,6 +1047,8 @@ class ZimBuilder(object):
         @type worker_options: L{zimfiction.zimbuild.worker.WorkerOptions}
         @param render_options: options for the renderer
         @type render_options: L{zimfiction.zimbuild.renderer.RenderOptions}
+        @param renderer: if specified, a renderer shared between the workers
+        @type renderer: L{zimfiction.zimbuild.renderer.HtmlRenderer} or L{None}
         """
         # prepare the process priority
         config_process(name="ZF worker {}".format(id), nice=10, ionice=5)
@@ -1032,6 +1060,7 @@ class ZimBuilder(object):
             engine=connection_config.connect(),
             options=worker_options,
             render_options=render_options,
+            renderer=renderer,
         )
         worker.run()
 
@@ -1044,10 +1073,10 @@ class ZimBuilder(object):
         """
         story_bucket_maker = BucketMaker(maxsize=STORIES_PER_TASK)
         select_story_ids_stmt = select(Story.uid)
-        result = session.execute(select_story_ids_stmt)
+        result = session.scalars(select_story_ids_stmt)
         # create buckets and turn them into tasks
-        for story in result:
-            bucket = story_bucket_maker.feed(story.uid)
+        for story_uid in result:
+            bucket = story_bucket_maker.feed(story_uid)
             if bucket is not None:
                 # send out a task
                 task = StoryRenderTask(story_uids=bucket)
@@ -1066,16 +1095,24 @@ class ZimBuilder(object):
         @type session: L{sqlalchemy.orm.Session}
         """
         # select from tag association such that we only add non-implied tags
+        # the number of stories listed in each tag is counted here as
+        # well, sparing the workers a query per tag
         select_tags_stmt = (
             select(
-                distinct(StoryTagAssociation.tag_uid)
-            ).where(
-                StoryTagAssociation.implication_level < ImplicationLevel.MIN_IMPLIED
+                StoryTagAssociation.tag_uid,
+                func.sum(
+                    case(
+                        (StoryTagAssociation.implication_level <= ImplicationLevel.MAX_LIST_INCLUDE, 1),
+                        else_=0,
+                    )
+                ),
             )
+            .group_by(StoryTagAssociation.tag_uid)
+            .having(func.min(StoryTagAssociation.implication_level) < ImplicationLevel.MIN_IMPLIED)
         )
-        result = session.scalars(select_tags_stmt)
-        for tag_uid in result:
-            task = TagRenderTask(uid=tag_uid)
+        result = session.execute(select_tags_stmt)
+        for tag_uid, n_stories in result:
+            task = TagRenderTask(uid=tag_uid, n_stories=int(n_stories))
             self.inqueue.put(task)
 
     def _send_author_tasks(self, session):
@@ -1086,9 +1123,9 @@ class ZimBuilder(object):
         @type session: L{sqlalchemy.orm.Session}
         """
         select_authors_stmt = select(Author.uid)
-        result = session.execute(select_authors_stmt)
-        for author in result:
-            task = AuthorRenderTask(uid = author.uid)
+        result = session.scalars(select_authors_stmt)
+        for author_uid in result:
+            task = AuthorRenderTask(uid=author_uid)
             self.inqueue.put(task)
 
     def _send_category_tasks(self, session):
@@ -1098,16 +1135,24 @@ class ZimBuilder(object):
         @param session: sqlalchemy session for data querying
         @type session: L{sqlalchemy.orm.Session}
         """
+        # the number of stories listed in each category is counted here
+        # as well, sparing the workers a query per category
         select_categories_stmt = (
             select(
-                distinct(StoryCategoryAssociation.category_uid)
-            ).where(
-                StoryCategoryAssociation.implication_level < ImplicationLevel.MIN_IMPLIED
+                StoryCategoryAssociation.category_uid,
+                func.sum(
+                    case(
+                        (StoryCategoryAssociation.implication_level <= ImplicationLevel.MAX_LIST_INCLUDE, 1),
+                        else_=0,
+                    )
+                ),
             )
+            .group_by(StoryCategoryAssociation.category_uid)
+            .having(func.min(StoryCategoryAssociation.implication_level) < ImplicationLevel.MIN_IMPLIED)
         )
-        result = session.scalars(select_categories_stmt)
-        for category_uid in result:
-            task = CategoryRenderTask(uid=category_uid)
+        result = session.execute(select_categories_stmt)
+        for category_uid, n_stories in result:
+            task = CategoryRenderTask(uid=category_uid, n_stories=int(n_stories))
             self.inqueue.put(task)
 
     def _send_series_tasks(self, session):
@@ -1118,9 +1163,9 @@ class ZimBuilder(object):
         @type session: L{sqlalchemy.orm.Session}
         """
         select_series_stmt = select(Series.uid)
-        result = session.execute(select_series_stmt)
-        for series in result:
-            task = SeriesRenderTask(uid=series.uid)
+        result = session.scalars(select_series_stmt)
+        for series_uid in result:
+            task = SeriesRenderTask(uid=series_uid)
             self.inqueue.put(task)
 
     def _send_publisher_tasks(self, session):
@@ -1131,9 +1176,9 @@ class ZimBuilder(object):
         @type session: L{sqlalchemy.orm.Session}
         """
         select_publishers_stmt = select(Publisher.uid)
-        result = session.execute(select_publishers_stmt)
-        for publisher in result:
-            task = PublisherRenderTask(uid=publisher.uid)
+        result = session.scalars(select_publishers_stmt)
+        for publisher_uid in result:
+            task = PublisherRenderTask(uid=publisher_uid)
             self.inqueue.put(task)
 
     def _send_etc_tasks(self, session):
@@ -4,22 +4,39 @@ The renderer generates HTML pages.
 import urllib.parse
 import json
 import datetime
-import math
+import functools
+import operator
+import hashlib
+import os
+import threading
 
-import htmlmin
 import mistune
-from jinja2 import Environment, PackageLoader, select_autoescape, Undefined
+from jinja2 import Environment, PackageLoader, FileSystemBytecodeCache
+from jinja2 import select_autoescape, Undefined
 
 # optional optimization dependencies
 try:
     import minify_html
 except ImportError:
     minify_html = None
+try:
+    import markdown_it_pyrs
+    from markdown_it_pyrs import MarkdownIt
+except ImportError:
+    markdown_it_pyrs = None
+    MarkdownIt = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import lmdb
+except ImportError:
+    lmdb = None
 
-from ..util import format_size, format_number, get_resource_file_path, repair_html
+from ..util import format_size, format_number, format_date, get_resource_file_path, repair_html, chunked
 from ..normalize import normalize_tag
 from ..statistics import StoryListStatCreator
-from .buckets import BucketMaker
 from .search import SearchMetadataCreator
 
 
@@ -31,13 +48,262 @@ MIN_STORIES_FOR_SEARCH = 5
 MAX_STORIES_FOR_SEARCH = float("inf")
 SEARCH_ONLY_ON_FIRST_PAGE = True
 MAX_ITEMS_PER_RESULT = 200
+QUOTED_TAG_CACHE_SIZE = 200000
+STORYTEXT_CACHE_MAP_SIZE = 1024 * 1024 * 1024  # initial size, grows when full
+STORYTEXT_CACHE_WRITE_BATCH = 256
+SHORT_STORYTEXT_LENGTH = 2048
+SHORT_STORYTEXT_CACHE_SIZE = 4096
+
+
+if MarkdownIt is not None:
+    # enable the extensions mistune.html() uses. Note that the html is
+    # not identical: e.g. strikethrough is rendered as <s> instead of
+    # <del> and footnotes use different ids and markup.
+    _MARKDOWN_PARSER = MarkdownIt("commonmark").enable_many(["strikethrough", "table", "footnote"])
+    _MARKDOWN_BACKEND = "markdown-it-pyrs {}".format(markdown_it_pyrs.__version__)
+else:
+    _MARKDOWN_PARSER = None
+    _MARKDOWN_BACKEND = "mistune {}".format(mistune.__version__)
+
+if minify_html is None:
+    # fall back to htmlmin, which is only imported when it is needed
+    import htmlmin
+    _minify_html = functools.partial(
+        htmlmin.minify,
+        remove_comments=True,
+        remove_empty_space=True,
+        reduce_boolean_attributes=True,
+        # remove_optional_attribute_quotes=True,
+        remove_optional_attribute_quotes=False,  # firefox complains for some tags
+    )
+else:
+    # htmlmin keeps optional closing tags and the <html> and <head>
+    # tags, which minify-html would otherwise remove. Keep them too, so
+    # the document structure does not depend on the installed minifier.
+    # Unlike htmlmin, minify-html still removes attribute quotes where
+    # the spec allows it.
+    _minify_html = functools.partial(
+        minify_html.minify,
+        keep_closing_tags=True,
+        keep_html_and_head_opening_tags=True,
+    )
+
+
+def _keep_html(s):
+    """
+    Return html code unchanged, used when minification is disabled.
+
+    @param s: html code
+    @type s: L{str}
+    @return: the html code
+    @rtype: L{str}
+    """
+    return s
+
+
+@functools.lru_cache(maxsize=QUOTED_TAG_CACHE_SIZE)
+def _quote_tag(value):
+    """
+    Normalize and quote a tag name for use in URLs.
+
+    The same tags are referenced on a lot of pages, so the results are
+    cached.
+
+    @param value: tag name to normalize
+    @type value: L{str}
+    @return: the normalized, encoded tag
+    @rtype: L{str}
+    """
+    return urllib.parse.quote_plus(normalize_tag(value))
+
+
+def _render_markdown(value):
+    """
+    Render markdown using the best available markdown renderer.
+
+    @param value: markdown to render
+    @type value: L{str}
+    @return: the rendered HTML
+    @rtype: L{str}
+    """
+    if _MARKDOWN_PARSER is not None:
+        return _MARKDOWN_PARSER.render(value)
+    else:
+        # fall back to mistune
+        return mistune.html(value)
+
+
+# short texts like notes or placeholder chapters are often repeated,
+# so their rendered html is kept in memory
+_render_short_markdown = functools.lru_cache(maxsize=SHORT_STORYTEXT_CACHE_SIZE)(_render_markdown)
+
+
+def _get_bytecode_cache():
+    """
+    Return the bytecode cache for the compiled templates.
+
+    The compiled templates are stored in the user cache directory, so
+    they persist between builds. If this directory can not be created,
+    the temporary directory is used instead.
+
+    @return: the bytecode cache to use
+    @rtype: L{jinja2.FileSystemBytecodeCache}
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    directory = os.path.join(cache_home, "zimfiction", "jinja")
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        return FileSystemBytecodeCache()
+    return FileSystemBytecodeCache(directory=directory)
+
+
+class _StorytextCache(object):
+    """
+    An on-disk cache for rendered storytexts, backed by lmdb.
+
+    lmdb environments can only be opened once per process and must not
+    be used across a fork, so instances should be retrieved using
+    L{_get_storytext_cache}. An instance may be shared between threads.
+    New entries are buffered and written in batches.
+
+    @ivar environment: the lmdb environment
+    @type environment: L{lmdb.Environment}
+    @ivar lock: lock guarding the environment and the pending entries
+    @type lock: L{threading.Lock}
+    @ivar pending: entries not yet written to the environment
+    @type pending: L{dict} of L{bytes} -> L{bytes}
+    """
+    def __init__(self, path):
+        """
+        The default constructor.
+
+        @param path: path of the directory containing the cache
+        @type path: L{str}
+        """
+        if lmdb is None:
+            raise ImportError("Could not import package 'lmdb' required for the storytext cache!")
+        self.environment = lmdb.open(
+            path,
+            map_size=STORYTEXT_CACHE_MAP_SIZE,
+            sync=False,  # this is only a cache
+        )
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    def _run_transaction(self, f, write=False):
+        """
+        Call f with a new transaction, resizing the map where required.
+
+        The lock must be held by the caller, as the map can only be
+        resized while no other transaction of this process is active.
+
+        @param f: function to call with the transaction
+        @type f: callable taking a L{lmdb.Transaction}
+        @param write: whether the transaction should be a write transaction
+        @type write: L{bool}
+        @return: the return value of f
+        @rtype: any
+        """
+        while True:
+            try:
+                with self.environment.begin(write=write) as txn:
+                    return f(txn)
+            except lmdb.MapFullError:
+                self.environment.set_mapsize(self.environment.info()["map_size"] * 2)
+            except lmdb.MapResizedError:
+                # another process grew the map, adopt the new size
+                self.environment.set_mapsize(0)
+
+    def get(self, key):
+        """
+        Return the cached html for a key.
+
+        @param key: key to lookup
+        @type key: L{bytes}
+        @return: the cached html or None if it is not cached
+        @rtype: L{str} or L{None}
+        """
+        with self.lock:
+            value = self.pending.get(key, None)
+            if value is None:
+                value = self._run_transaction(lambda txn: txn.get(key))
+        if value is None:
+            return None
+        return value.decode("utf-8")
+
+    def put(self, key, value):
+        """
+        Cache the html for a key.
+
+        @param key: key to store the html under
+        @type key: L{bytes}
+        @param value: html to store
+        @type value: L{str}
+        """
+        with self.lock:
+            self.pending[key] = value.encode("utf-8")
+            if len(self.pending) >= STORYTEXT_CACHE_WRITE_BATCH:
+                self._flush()
+
+    def flush(self):
+        """
+        Write all pending entries to the environment.
+        """
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        """
+        Write all pending entries to the environment.
+
+        The lock must be held by the caller.
+        """
+        if not self.pending:
+            return
+        self._run_transaction(
+            lambda txn: txn.cursor().putmulti(self.pending.items()),
+            write=True,
+        )
+        self.pending.clear()
+
+
+# the open storytext caches, by path. See _get_storytext_cache()
+_storytext_caches = {}
+_storytext_caches_lock = threading.Lock()
+
+
+def _get_storytext_cache(path):
+    """
+    Return the storytext cache for a path, opening it if required.
+
+    Each process opens a cache only once, even if it is used by
+    multiple renderers or threads.
+
+    @param path: path of the directory containing the cache
+    @type path: L{str}
+    @return: the storytext cache
+    @rtype: L{_StorytextCache}
+    """
+    path = os.path.abspath(path)
+    pid = os.getpid()
+    with _storytext_caches_lock:
+        cache_pid, cache = _storytext_caches.get(path, (None, None))
+        if cache_pid != pid:
+            # never opened or inherited from the parent process
+            cache = _StorytextCache(path)
+            _storytext_caches[path] = (pid, cache)
+        return cache
 
 
 class RenderedObject(object):
     """
     Base class for render results.
+
+    Rendered objects are created for every single page, so all
+    subclasses should define __slots__.
     """
-    pass
+    __slots__ = ()
 
 
 class HtmlPage(RenderedObject):
@@ -48,11 +314,13 @@ class HtmlPage(RenderedObject):
     @type path: L{str}
     @ivar title: title of the page
     @type title: L{str}
-    @ivar content: the HTML code of the page
-    @type content: L{str}
+    @ivar content: the UTF-8 encoded HTML code of the page
+    @type content: L{bytes}
     @ivar is_front: True if this is a front article
     @type is_front: L{bool}
     """
+    __slots__ = ("path", "title", "content", "is_front")
+
     def __init__(self, path, title, content, is_front=True):
         """
         The default constructor.
@@ -62,16 +330,20 @@ class HtmlPage(RenderedObject):
         @param title: title of the page
         @type title: L{str}
         @param content: the HTML code of the page
-        @param content: L{str}
+        @param content: L{str} or L{bytes}
         @param is_front: True if this is a front article
         @type is_front: L{bool}
         """
         assert isinstance(path, str)
         assert isinstance(title, str)
-        assert isinstance(content, str)
+        assert isinstance(content, (str, bytes))
         assert isinstance(is_front, bool)
         self.path = path
         self.title = title
+        if isinstance(content, str):
+            # encode here, in the worker, rather than in the creator
+            # thread. This also makes the page cheaper to pickle.
+            content = content.encode("utf-8")
         self.content = content
         self.is_front = is_front
 
@@ -85,9 +357,11 @@ class JsonObject(RenderedObject):
     @ivar title: title of the object
     @type title: L{str}
     @ivar content: the serialized json object to store
-    @type content: L{str}
+    @type content: L{str} or L{bytes}
     """
-    def __init__(self, path, title, content):
+    __slots__ = ("path", "title", "content")
+
+    def __init__(self, path, title, content, serialized=False):
         """
         The default constructor.
 
@@ -97,12 +371,21 @@ class JsonObject(RenderedObject):
         @type title: L{str}
         @ivar content: the json object to store
         @type content: json-serializable
+        @ivar serialized: if nonzero, content is already serialized json
+        @type serialized: L{bool}
         """
         assert isinstance(path, str)
         assert isinstance(title, str)
         self.path = path
         self.title = title
-        self.content = json.dumps(content, separators=(",", ":"))
+        if serialized:
+            assert isinstance(content, (str, bytes))
+            self.content = content
+        elif orjson is None:
+            self.content = json.dumps(content, separators=(",", ":"))
+        else:
+            # orjson directly produces compact, UTF-8 encoded bytes
+            self.content = orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
 
 
 class Script(RenderedObject):
@@ -116,6 +399,8 @@ class Script(RenderedObject):
     @ivar content: the script itself
     @type content: L{str}
     """
+    __slots__ = ("path", "title", "content")
+
     def __init__(self, path, title, content):
         """
         The default constructor.
@@ -147,6 +432,8 @@ class Redirect(RenderedObject):
     @ivar is_front: True if this is a front article
     @type is_front: L{bool}
     """
+    __slots__ = ("source", "target", "title", "is_front")
+
     def __init__(self, source, target, title, is_front=False):
         """
         The default constructor.
@@ -171,9 +458,11 @@ class RenderResult(object):
     This class encapsulates a list of  multiple L{RenderedObject},
     which together make up a rendered result.
 
-    @ivar _objects: list of the rendered objects
-    @type _objects: L{list} of L{RenderedObject}
+    @ivar objects: list of the rendered objects
+    @type objects: L{list} of L{RenderedObject}
     """
+    __slots__ = ("objects", )
+
     def __init__(self, objects=None):
         """
         The default constructor.
@@ -182,11 +471,11 @@ class RenderResult(object):
         @type objects: L{None} or L{RenderedObject} or L{list} of L{RenderedObject}
         """
         if objects is None:
-            self._objects = []
+            self.objects = []
         elif isinstance(objects, RenderedObject):
-            self._objects = [objects]
+            self.objects = [objects]
         elif isinstance(objects, (tuple, list)):
-            self._objects = list(objects)
+            self.objects = list(objects)
         else:
             raise TypeError("Expected None, RenderedObject or list/tuple of RenderedObject, got {} instead!".format(repr(objects)))
 
@@ -197,17 +486,16 @@ class RenderResult(object):
         @param object: object to add
         @type object: L{RenderedObject}
         """
-        self._objects.append(obj)
+        self.objects.append(obj)
 
     def iter_objects(self):
         """
         Iterate over the objects in this result.
 
-        @yields: the objects in this result
-        @ytype: L{RenderedObject}
+        @return: an iterator over the objects in this result
+        @rtype: iterator of L{RenderedObject}
         """
-        for obj in self._objects:
-            yield obj
+        return iter(self.objects)
 
 
 class RenderOptions(object):
@@ -216,15 +504,30 @@ class RenderOptions(object):
 
     @ivar include_external_links: whether external links should be included
     @type include_external_links: L{bool}
+    @ivar minify: whether the html pages should be minified
+    @type minify: L{bool}
+    @ivar storytext_cache_directory: if not None, cache rendered storytexts in this directory
+    @type storytext_cache_directory: L{str} or L{None}
     """
-    def __init__(self, include_external_links=False):
+    def __init__(
+        self,
+        include_external_links=False,
+        minify=True,
+        storytext_cache_directory=None,
+        ):
         """
         The default constructor.
 
         @param include_external_links: whether external links should be included
         @type include_external_links: L{bool}
+        @param minify: whether the html pages should be minified
+        @type minify: L{bool}
+        @param storytext_cache_directory: if not None, cache rendered storytexts in this directory
+        @type storytext_cache_directory: L{str} or L{None}
         """
         self.include_external_links = include_external_links
+        self.minify = minify
+        self.storytext_cache_directory = storytext_cache_directory
 
 
 class HtmlRenderer(object):
@@ -235,6 +538,8 @@ class HtmlRenderer(object):
     @type environment: L{jinja2.environment}
     @ivar options: render options
     @type options: L{RenderOptions}
+    @ivar minify_html: function used to minify the html code of a page
+    @type minify_html: callable taking and returning L{str}
     """
     def __init__(self, options):
         """
@@ -246,11 +551,27 @@ class HtmlRenderer(object):
         assert isinstance(options, RenderOptions)
         self.options = options
 
+        # choose the minifier once, rather than on each page
+        if self.options.minify:
+            self.minify_html = _minify_html
+        else:
+            self.minify_html = _keep_html
+
+        # the rendered html depends on the markdown renderer, so it is
+        # part of the storytext cache keys, as is the minification
+        self._storytext_cache_key_prefix = "{}|minify={}|".format(
+            _MARKDOWN_BACKEND,
+            self.options.minify,
+        ).encode("utf-8")
+
         # setup jinja environment
         self.environment = Environment(
             loader=PackageLoader("zimfiction.zimbuild"),
             auto_reload=False,
             autoescape=select_autoescape(),
+            cache_size=-1,  # never evict compiled templates
+            # keep the compiled templates between builds
+            bytecode_cache=_get_bytecode_cache(),
         )
 
         # configure environment globals
@@ -260,7 +581,8 @@ class HtmlRenderer(object):
         self.environment.filters["render_storytext"] = self._render_storytext_filter
         self.environment.filters["format_number"] = format_number
         self.environment.filters["format_size"] = format_size
-        self.environment.filters["normalize_tag"] = self._normalize_tag
+        # the cached quoting function is used directly, skipping a method call
+        self.environment.filters["normalize_tag"] = _quote_tag
         self.environment.filters["format_date"] = self._format_date
         self.environment.filters["first_elements"] = self._first_elements
         self.environment.filters["default_index"] = self._default_index
@@ -269,60 +591,86 @@ class HtmlRenderer(object):
         # configure tests
         self.environment.tests["date"] = self._is_date
 
-    @staticmethod
-    def minify_html(s):
+        # resolve frequently used templates once
+        self._chapter_template = self.environment.get_template("chapter.html.jinja")
+        self._chapter_index_template = self.environment.get_template("chapter_index.html.jinja")
+        self._list_page_template = self.environment.get_template("storylistpage.html.jinja")
+        self._stats_page_template = self.environment.get_template("storyliststatspage.html.jinja")
+        self._author_template = self.environment.get_template("author.html.jinja")
+        self._series_template = self.environment.get_template("series.html.jinja")
+        self._publisher_template = self.environment.get_template("publisher.html.jinja")
+        self._category_page_template = self.environment.get_template("category_long_list_page.html.jinja")
+        self._index_template = self.environment.get_template("index.html.jinja")
+        self._info_template = self.environment.get_template("info.html.jinja")
+        self._acknowledgements_template = self.environment.get_template("acknowledgements.html.jinja")
+
+    def preload_templates(self):
         """
-        Minify html code.
+        Load and compile all templates of the environment.
 
-        @param s: html code to minify
-        @type s: L{str}
-        @return: the minified html
-        @rtype: L{str}
+        Templates are otherwise compiled lazily on first use. Calling
+        this before the renderer is shared (e.g. with worker threads or
+        forked worker processes) ensures that the compilation happens
+        only once.
         """
-        if minify_html is None:
-            # fall back to htmlmin
-            return htmlmin.minify(
-                s,
-                remove_comments=True,
-                remove_empty_space=True,
-                reduce_boolean_attributes=True,
-                # remove_optional_attribute_quotes=True,
-                remove_optional_attribute_quotes=False,  # firefox complains for some tags
-            )
-        else:
-            return minify_html.minify(
-                s,
-            )
+        for template_name in self.environment.list_templates():
+            self.environment.get_template(template_name)
+
+    def flush_storytext_cache(self):
+        """
+        Write all pending entries of the storytext cache to disk.
+
+        New entries of the storytext cache are written in batches. This
+        method should be called once the renderer is no longer used.
+        """
+        if self.options.storytext_cache_directory is not None:
+            _get_storytext_cache(self.options.storytext_cache_directory).flush()
 
     def render_story(self, story):
         """
         Render a story.
 
+        The pages are yielded in multiple results, so stories with a lot
+        of chapters do not need to be kept in memory at once.
+
         @param story: story to render
         @type story: L{zimfiction.db.models.Story}
-        @return: the rendered pages and redirects
-        @rtype: L{RenderResult}
+        @return: a generator yielding the rendered pages and redirects
+        @rtype: generator yielding L{RenderResult}
         """
-        # NOTE: not keeping track of items per result here
-        # -> stories with 198+ chapters are relatively rare and shouldn't cause RAM problems
         result = RenderResult()
-        chapter_template = self.environment.get_template("chapter.html.jinja")
+        items_in_result = 0
+        publisher_name = story.publisher.name
+        base_path = "story/{}/{}/".format(publisher_name, story.id)
+        title_prefix = "{} by {}".format(story.title, story.author.name)
+        chapter_title_prefix = title_prefix + " - Chapter "
+        chapter_template = self._chapter_template
+        minify = self.minify_html
         min_chapter_i = None
         is_first = True
         for chapter in story.chapters:
-            chapter_page = chapter_template.render(
-                chapter=chapter,
-                is_first=is_first,
-                to_root="../../..",
-            )
+            # NOTE: the intermediate html strings are intentionally not
+            # bound to any names, so each one is freed as soon as it has
+            # been minified or encoded. Chapters can be quite large.
             result.add(
                 HtmlPage(
-                    path="story/{}/{}/{}".format(story.publisher.name, story.id, chapter.index),
-                    title="{} by {} - Chapter {} - {}".format(story.title, story.author.name, chapter.index, chapter.title),
-                    content=self.minify_html(chapter_page),
+                    path=base_path + str(chapter.index),
+                    title=chapter_title_prefix + str(chapter.index) + " - " + chapter.title,
+                    content=minify(
+                        chapter_template.render(
+                            chapter=chapter,
+                            is_first=is_first,
+                            to_root="../../..",
+                        ),
+                    ),
                     is_front=False,  # redirect to first chapter will be front
                 ),
             )
+            items_in_result += 1
+            if items_in_result >= MAX_ITEMS_PER_RESULT:
+                yield result
+                result = RenderResult()
+                items_in_result = 0
             # keep track of lowest chapter index so we can redirect to it
             if (min_chapter_i is None) or (chapter.index < min_chapter_i):
                 min_chapter_i = chapter.index
@@ -330,37 +678,37 @@ class HtmlRenderer(object):
         # add redirect from story -> page 1
         result.add(
             Redirect(
-                "story/{}/{}/".format(story.publisher.name, story.id),
-                "story/{}/{}/{}".format(story.publisher.name, story.id, min_chapter_i),
-                title="{} by {} on {}".format(story.title, story.author.name, story.publisher.name),
+                base_path,
+                base_path + str(min_chapter_i),
+                title=title_prefix + " on " + publisher_name,
                 is_front=True,
             ),
         )
         # add index
-        chapter_index_template = self.environment.get_template("chapter_index.html.jinja")
+        chapter_index_template = self._chapter_index_template
         chapter_index_page = chapter_index_template.render(
             story=story,
             to_root="../../..",
         )
         result.add(
             HtmlPage(
-                path="story/{}/{}/index".format(story.publisher.name, story.id),
-                content=self.minify_html(chapter_index_page),
-                title="{} by {} on {} - List of chapters".format(story.title, story.author.name, story.publisher.name),
+                path=base_path + "index",
+                content=minify(chapter_index_page),
+                title=title_prefix + " on " + publisher_name + " - List of chapters",
                 is_front=False,
             ),
         )
         # add preview json
         result.add(
             JsonObject(
-                path="story/{}/{}/preview.json".format(story.publisher.name, story.id),
+                path=base_path + "preview.json",
                 content=story.get_preview_data(),
                 title="",
             ),
         )
-        return result
+        yield result
 
-    def render_tag(self, tag, stories=None, num_stories=None, statistics=None):
+    def render_tag(self, tag, stories=None, num_stories=None, statistics=None, search_metadata=None):
         """
         Render a tag.
 
@@ -376,70 +724,93 @@ class HtmlRenderer(object):
         @type num_stories: L{int} or L{None}
         @param statistics: if specified, use these statistics rather than collecting them
         @type statistics: L{zimfiction.statistics.StoryListStats}
-        @return: the rendered pages and redirects
-        @rtype: L{RenderResult}
+        @param search_metadata: if specified, use this search metadata rather than collecting it
+        @type search_metadata: L{zimfiction.zimbuild.search.SearchMetadataCreator}
+        @return: a generator yielding the rendered pages and redirects
+        @rtype: generator yielding L{RenderResult}
         """
-        # general preparations
         if stories is None:
             num_stories = len(tag.stories)
-            stories = sorted(tag.stories, key=lambda x: (x.score, x.total_words), reverse=True)
-        else:
-            assert num_stories is not None
-        result = RenderResult()
-        items_in_result = 0
+            stories = sorted(tag.stories, key=operator.attrgetter("score", "total_words"), reverse=True)
+        title_prefix = "Stories tagged '{}' [{}]".format(tag.name, tag.type)
+        return self._render_story_list(
+            base_path="tag/{}/{}/".format(tag.type, normalize_tag(tag.name)),
+            title_prefix=title_prefix,
+            redirect_title=title_prefix,
+            stories=stories,
+            num_stories=num_stories,
+            statistics=statistics,
+            search_metadata=search_metadata,
+        )
+
+    def _render_story_list(self, base_path, title_prefix, redirect_title, stories, num_stories, statistics=None, search_metadata=None):
+        """
+        Render a paginated list of stories, like the ones of tags and categories.
+
+        This renders the story list pages, a redirect to the first page,
+        the statistics and, if there are enough stories, the search
+        metadata.
+
+        @param base_path: path prefix of all objects of the list
+        @type base_path: L{str}
+        @param title_prefix: prefix of the titles of the list pages
+        @type title_prefix: L{str}
+        @param redirect_title: title of the redirect to the first page
+        @type redirect_title: L{str}
+        @param stories: an iterable yielding the stories in the order they should be listed
+        @type stories: iterable yielding L{zimfiction.db.models.Story}
+        @param num_stories: number of stories in the list
+        @type num_stories: L{int}
+        @param statistics: if specified, use these statistics rather than collecting them
+        @type statistics: L{zimfiction.statistics.StoryListStats}
+        @param search_metadata: if specified, use this search metadata (already fed with the stories) rather than collecting it
+        @type search_metadata: L{zimfiction.zimbuild.search.SearchMetadataCreator}
+        @return: a generator yielding the rendered pages and redirects
+        @rtype: generator yielding L{RenderResult}
+        """
+        assert num_stories is not None
         if num_stories == 0:
-            # tag has no stories
+            # list has no stories
             # this can happen if a tag is only implied
             # we do not return any page in this case
-            return result
+            return
+        max_items_per_result = MAX_ITEMS_PER_RESULT
+        result = RenderResult()
+        items_in_result = 0
         # default redirect to page 1
         result.add(
             Redirect(
-                "tag/{}/{}/".format(tag.type, normalize_tag(tag.name)),
-                "tag/{}/{}/1".format(tag.type, normalize_tag(tag.name)),
-                title="Stories tagged '{}' [{}]".format(tag.name, tag.type),
+                base_path,
+                base_path + "1",
+                title=redirect_title,
                 is_front=True,
             ),
         )
         items_in_result += 1
         # prepare rendering the story list pages
-        list_page_template = self.environment.get_template("storylistpage.html.jinja")
+        list_page_template = self._list_page_template
         include_search = (num_stories >= MIN_STORIES_FOR_SEARCH) and (num_stories <= MAX_STORIES_FOR_SEARCH)
         include_stats = True
         collect_stats = (statistics is None) and include_stats
+        collect_search = (search_metadata is None) and include_search
         if collect_stats:
             stat_creator = StoryListStatCreator()
-        num_pages = math.ceil(num_stories / STORIES_PER_PAGE)
-        bucketmaker = BucketMaker(STORIES_PER_PAGE)
-        if include_search:
-            search_creator = SearchMetadataCreator(max_page_size=SEARCH_ITEMS_PER_FILE)
+            stat_feed = stat_creator.feed
+        num_pages = -(-num_stories // STORIES_PER_PAGE)  # ceil division
+        if collect_search:
+            search_metadata = SearchMetadataCreator(max_page_size=SEARCH_ITEMS_PER_FILE)
+            search_feed = search_metadata.feed
         # render the story list pages
-        page_index = 1
-        for story in stories:
+        for page_index, bucket in enumerate(chunked(stories, STORIES_PER_PAGE), start=1):
             if collect_stats:
-                stat_creator.feed(story)
-            if include_search:
-                search_creator.feed(story)
-            bucket = bucketmaker.feed(story)
-            if bucket is not None:
-                items_in_result += self._render_tag_page(
-                    tag=tag,
-                    stories=bucket,
-                    page_index=page_index,
-                    num_pages=num_pages,
-                    template=list_page_template,
-                    result=result,
-                    include_search=include_search,
-                )
-                if items_in_result >= MAX_ITEMS_PER_RESULT:
-                    yield result
-                    result = RenderResult()
-                    items_in_result = 0
-                page_index += 1
-        bucket = bucketmaker.finish()
-        if bucket is not None:
-            items_in_result += self._render_tag_page(
-                tag=tag,
+                for story in bucket:
+                    stat_feed(story)
+            if collect_search:
+                for story in bucket:
+                    search_feed(story)
+            items_in_result += self._render_story_list_page(
+                base_path=base_path,
+                title_prefix=title_prefix,
                 stories=bucket,
                 page_index=page_index,
                 num_pages=num_pages,
@@ -447,32 +818,35 @@ class HtmlRenderer(object):
                 result=result,
                 include_search=include_search,
             )
-            if items_in_result >= MAX_ITEMS_PER_RESULT:
+            if items_in_result >= max_items_per_result:
                 yield result
                 result = RenderResult()
                 items_in_result = 0
+        # release the last page of stories before rendering the rest
+        bucket = None
         # add statistics
         if collect_stats:
             statistics = stat_creator.get_stats()
         if include_stats:
-            stats_page_template = self.environment.get_template("storyliststatspage.html.jinja")
+            stats_page_template = self._stats_page_template
+            stats_title = title_prefix + " - Statistics"
             page = stats_page_template.render(
                 to_root="../../..",
-                title="Stories tagged '{}' [{}] - Statistics".format(tag.name, tag.type),
+                title=stats_title,
                 stats=statistics,
                 backref="1",
             )
             result.add(
                 HtmlPage(
-                    path="tag/{}/{}/stats".format(tag.type, normalize_tag(tag.name)),
+                    path=base_path + "stats",
                     content=self.minify_html(page),
-                    title="Stories tagged '{}' [{}] - Statistics".format(tag.name, tag.type),
+                    title=stats_title,
                     is_front=False
                 )
             )
             result.add(
                 JsonObject(
-                    path="tag/{}/{}/storyupdates.json".format(tag.type, normalize_tag(tag.name)),
+                    path=base_path + "storyupdates.json",
                     title="",
                     content=statistics.timeline,
                 ),
@@ -480,39 +854,42 @@ class HtmlRenderer(object):
             items_in_result += 2
         # add search
         if include_search:
-            search_header_data = search_creator.get_search_header()
+            search_header_data = search_metadata.get_search_header()
             result.add(
                 JsonObject(
-                    path="tag/{}/{}/search_header.json".format(tag.type, normalize_tag(tag.name)),
+                    path=base_path + "search_header.json",
                     title="",
                     content=search_header_data,
                 ),
             )
             items_in_result += 1
-            for i, search_data in search_creator.iter_search_pages():
+            for i, search_data in search_metadata.iter_search_pages():
                 result.add(
                     JsonObject(
-                        path="tag/{}/{}/search_content_{}.json".format(tag.type, normalize_tag(tag.name), i),
+                        path=base_path + "search_content_{}.json".format(i),
                         title="",
                         content=search_data,
+                        serialized=True,
                     ),
                 )
                 items_in_result += 1
-                if items_in_result >= MAX_ITEMS_PER_RESULT:
+                if items_in_result >= max_items_per_result:
                     yield result
                     result = RenderResult()
                     items_in_result = 0
         yield result
 
-    def _render_tag_page(self, tag, stories, page_index, num_pages, template, result, include_search):
+    def _render_story_list_page(self, base_path, title_prefix, stories, page_index, num_pages, template, result, include_search):
         """
-        Helper function for rendering a tag page of stories.
+        Helper function for rendering a page of a story list.
 
-        This function renders a page of stories in the tag and adds the
+        This function renders a page of stories in the list and adds the
         rendered page to the result.
 
-        @param tag: tag this page is for
-        @type tag: L{zimfiction.db.models.Tag}
+        @param base_path: path prefix of the pages of the list
+        @type base_path: L{str}
+        @param title_prefix: prefix of the titles of the pages of the list
+        @type title_prefix: L{str}
         @param stories: list of stories that should be listed on this page
         @type stories: L{list} of L{zimfiction.db.models.Story}
         @param page_index: index of current page (1-based)
@@ -523,102 +900,117 @@ class HtmlRenderer(object):
         @type template: L{jinja2.Template}
         @param result: result the rendered page should be added to
         @type result: L{RenderResult}
-        @param include_search: whether search should be included for this tag
+        @param include_search: whether search should be included for this list
         @type include_search: L{bool}
         @return: the number of items added to the render result
         @rtype: L{int}
         """
-        page = template.render(
-            to_root="../../..",
-            title="Stories tagged '{}' [{}] - Page {}".format(tag.name, tag.type, page_index),
-            stories=stories,
-            include_search=(include_search and (page_index == 1 or not SEARCH_ONLY_ON_FIRST_PAGE)),
-            num_pages=num_pages,
-            cur_page=page_index,
-        )
+        title = title_prefix + " - Page " + str(page_index)
         result.add(
             HtmlPage(
-                path="tag/{}/{}/{}".format(tag.type, normalize_tag(tag.name), page_index),
-                content=self.minify_html(page),
-                title="Stories tagged '{}' [{}] - Page {}".format(tag.name, tag.type, page_index),
+                path=base_path + str(page_index),
+                content=self.minify_html(
+                    template.render(
+                        to_root="../../..",
+                        title=title,
+                        stories=stories,
+                        include_search=(include_search and (page_index == 1 or not SEARCH_ONLY_ON_FIRST_PAGE)),
+                        num_pages=num_pages,
+                        cur_page=page_index,
+                    ),
+                ),
+                title=title,
                 is_front=False,
             ),
         )
         return 1  # 1 item added
 
-    def render_author(self, author, other_identities=[]):
+    def render_author(self, author, other_identities=[], stories=None):
         """
         Render an author.
 
+        If stories is specified, it should be a list of the stories of
+        the author sorted by publication date descending. If it is not
+        specified, it will be generated from author.stories
+
         @param author: author to render
         @type author: L{zimfiction.db.models.Author}
         @param other_identities: list of potential other identities of this author on other sites
         @type other_identities: L{list} of L{zimfiction.db.models.Author}
-        @return: the rendered pages and redirects
-        @rtype: L{RenderResult}
+        @param stories: the stories of the author in a sorted order as described above
+        @type stories: L{list} of L{zimfiction.db.models.Story} or L{None}
+        @return: a generator yielding the rendered pages and redirects
+        @rtype: generator yielding L{RenderResult}
         """
-        # NOTE: not keeping track of items per result here
-        # -> authors with MAX_ITEMS_PER_RESULT*STORIES_PER_PAGE are rare
-        #    and should not cause memory problems
+        if stories is None:
+            stories = sorted(author.stories, key=operator.attrgetter("published"), reverse=True)
+        elif not isinstance(stories, list):
+            stories = list(stories)
         result = RenderResult()
-        bucketmaker = BucketMaker(STORIES_PER_PAGE)
+        items_in_result = 0
+        publisher_name = author.publisher.name
+        base_path = "author/{}/{}/".format(publisher_name, normalize_tag(author.name))
         result.add(
             Redirect(
-                "author/{}/{}/".format(author.publisher.name, normalize_tag(author.name)),
-                "author/{}/{}/1".format(author.publisher.name, normalize_tag(author.name)),
-                title="Author {} on {}".format(author.name, author.publisher.name),
+                base_path,
+                base_path + "1",
+                title="Author {} on {}".format(author.name, publisher_name),
                 is_front=True,
             ),
         )
-        list_page_template = self.environment.get_template("author.html.jinja")
-        pages = []
+        items_in_result += 1
+        list_page_template = self._author_template
+        minify = self.minify_html
         stat_creator = StoryListStatCreator()
-        for story in sorted(author.stories, key=lambda x: x.published, reverse=True):
-            stat_creator.feed(story)
-            bucket = bucketmaker.feed(story)
-            if bucket is not None:
-                pages.append(bucket)
-        bucket = bucketmaker.finish()
-        if bucket is not None:
-            pages.append(bucket)
-        if not pages:
-            # for some reason, it can happen that an author does not
-            # have any associated stories. This is most likely a bug
-            # probably somewhere in the import
-            # Until that one is fixed, we need to ensure that there's
-            # always at least on (perhaps empty) page for each author
-            # otherwise some redirects and links won't work correctly
-            pages.append([])
+        stat_feed = stat_creator.feed
+        for story in stories:
+            stat_feed(story)
         stats = stat_creator.get_stats()
-        for i, stories in enumerate(pages, start=1):
-            page = list_page_template.render(
-                to_root="../../..",
-                author=author,
-                other_identities=other_identities,
-                stories=stories,
-                stats=stats,
-                num_pages=len(pages),
-                cur_page=i,
-            )
+        # for some reason, it can happen that an author does not
+        # have any associated stories. This is most likely a bug
+        # probably somewhere in the import
+        # Until that one is fixed, we need to ensure that there's
+        # always at least on (perhaps empty) page for each author
+        # otherwise some redirects and links won't work correctly
+        num_pages = max(-(-len(stories) // STORIES_PER_PAGE), 1)
+        for i in range(1, num_pages + 1):
+            start = (i - 1) * STORIES_PER_PAGE
+            # the unminified html is not bound to a name, so it does
+            # not stay alive while the result is yielded
             result.add(
                 HtmlPage(
-                    path="author/{}/{}/{}".format(author.publisher.name, normalize_tag(author.name), i),
-                    content=self.minify_html(page),
-                    title="Author {} on {} - Page {}".format(author.name, author.publisher.name, i),
+                    path=base_path + str(i),
+                    content=minify(
+                        list_page_template.render(
+                            to_root="../../..",
+                            author=author,
+                            other_identities=other_identities,
+                            stories=stories[start:start + STORIES_PER_PAGE],
+                            stats=stats,
+                            num_pages=num_pages,
+                            cur_page=i,
+                        ),
+                    ),
+                    title="Author {} on {} - Page {}".format(author.name, publisher_name, i),
                     is_front=False,
                 ),
             )
+            items_in_result += 1
+            if items_in_result >= MAX_ITEMS_PER_RESULT:
+                yield result
+                result = RenderResult()
+                items_in_result = 0
         result.add(
             JsonObject(
-                path="author/{}/{}/storyupdates.json".format(author.publisher.name, normalize_tag(author.name)),
+                path=base_path + "storyupdates.json",
                 title="",
                 content=stats.timeline,
             )
         )
-        return result
+        yield result
 
 
-    def render_category(self, category, stories=None, num_stories=None, statistics=None):
+    def render_category(self, category, stories=None, num_stories=None, statistics=None, search_metadata=None):
         """
         Render an category.
 
@@ -634,176 +1026,24 @@ class HtmlRenderer(object):
         @type num_stories: L{int} or L{None}
         @param statistics: if specified, use these statistics rather than collecting them
         @type statistics: L{zimfiction.statistics.StoryListStats}
-        @return: the rendered pages and redirects
-        @rtype: L{RenderResult}
+        @param search_metadata: if specified, use this search metadata rather than collecting it
+        @type search_metadata: L{zimfiction.zimbuild.search.SearchMetadataCreator}
+        @return: a generator yielding the rendered pages and redirects
+        @rtype: generator yielding L{RenderResult}
         """
-        # general preparations
         if stories is None:
             num_stories = len(category.stories)
-            stories = sorted(category.stories, key=lambda x: (x.score, x.total_words), reverse=True)
-        else:
-            assert num_stories is not None
-        result = RenderResult()
-        items_in_result = 0
-        if num_stories == 0:
-            # tag has no stories
-            # this can happen if a tag is only implied
-            # we do not return any page in this case
-            return result
-        # default redirect to page 1
-        result.add(
-            Redirect(
-                "category/{}/{}/".format(category.publisher.name, normalize_tag(category.name)),
-                "category/{}/{}/1".format(category.publisher.name, normalize_tag(category.name)),
-                title="Category: {} on {}".format(category.name, category.publisher.name),
-                is_front=True,
-            ),
-        )
-        items_in_result += 1
-        # prepare rendering the story list pages
-        list_page_template = self.environment.get_template("storylistpage.html.jinja")
-        include_search = (num_stories >= MIN_STORIES_FOR_SEARCH) and (num_stories <= MAX_STORIES_FOR_SEARCH)
-        include_stats = True
-        collect_stats = (statistics is None) and include_stats
-        if collect_stats:
-            stat_creator = StoryListStatCreator()
-        num_pages = math.ceil(num_stories / STORIES_PER_PAGE)
-        bucketmaker = BucketMaker(STORIES_PER_PAGE)
-        if include_search:
-            search_creator = SearchMetadataCreator(max_page_size=SEARCH_ITEMS_PER_FILE)
-        # render the story list pages
-        page_index = 1
-        for story in stories:
-            if collect_stats:
-                stat_creator.feed(story)
-            if include_search:
-                search_creator.feed(story)
-            bucket = bucketmaker.feed(story)
-            if bucket is not None:
-                items_in_result += self._render_category_page(
-                    category=category,
-                    stories=bucket,
-                    page_index=page_index,
-                    num_pages=num_pages,
-                    template=list_page_template,
-                    result=result,
-                    include_search=include_search,
-                )
-                if items_in_result >= MAX_ITEMS_PER_RESULT:
-                    yield result
-                    result = RenderResult()
-                    items_in_result = 0
-                page_index += 1
-        bucket = bucketmaker.finish()
-        if bucket is not None:
-            items_in_result += self._render_category_page(
-                category=category,
-                stories=bucket,
-                page_index=page_index,
-                num_pages=num_pages,
-                template=list_page_template,
-                result=result,
-                include_search=include_search,
-            )
-            if items_in_result >= MAX_ITEMS_PER_RESULT:
-                yield result
-                result = RenderResult()
-                items_in_result = 0
-        # add statistics
-        if collect_stats:
-            statistics = stat_creator.get_stats()
-        if include_stats:
-            stats_page_template = self.environment.get_template("storyliststatspage.html.jinja")
-            page = stats_page_template.render(
-                to_root="../../..",
-                title="{} fanfiction on {} - Statistics".format(category.name, category.publisher.name),
-                stats=statistics,
-                backref="1",
-            )
-            result.add(
-                HtmlPage(
-                    path="category/{}/{}/stats".format(category.publisher.name, normalize_tag(category.name)),
-                    content=self.minify_html(page),
-                    title="{} fanfiction on {} - Statistics".format(category.name, category.publisher.name),
-                    is_front=False
-                )
-            )
-            result.add(
-                JsonObject(
-                    path="category/{}/{}/storyupdates.json".format(category.publisher.name, normalize_tag(category.name)),
-                    title="",
-                    content=statistics.timeline,
-                )
-            )
-            items_in_result += 2
-        # add search
-        if include_search:
-            search_header_data = search_creator.get_search_header()
-            result.add(
-                JsonObject(
-                    path="category/{}/{}/search_header.json".format(category.publisher.name, normalize_tag(category.name)),
-                    title="",
-                    content=search_header_data,
-                ),
-            )
-            for i, search_data in search_creator.iter_search_pages():
-                result.add(
-                    JsonObject(
-                        path="category/{}/{}/search_content_{}.json".format(category.publisher.name, normalize_tag(category.name), i),
-                        title="",
-                        content=search_data,
-                    ),
-                )
-                items_in_result += 1
-                if items_in_result >= MAX_ITEMS_PER_RESULT:
-                    yield result
-                    result = RenderResult()
-                    items_in_result = 0
-        yield result
-
-    def _render_category_page(self, category, stories, page_index, num_pages, template, result, include_search):
-        """
-        Helper function for rendering a category page of stories.
-
-        This function renders a page of stories in the category and adds the
-        rendered page to the result.
-
-        @param category: category this page is for
-        @type category: L{zimfiction.db.models.Category}
-        @param stories: list of stories that should be listed on this page
-        @type stories: L{list} of L{zimfiction.db.models.Story}
-        @param page_index: index of current page (1-based)
-        @type page_index: L{int}
-        @param num_pages: total number of pages
-        @type num_pages: L{int}
-        @param template: template that should be rendered
-        @type template: L{jinja2.Template}
-        @param result: result the rendered page should be added to
-        @type result: L{RenderResult}
-        @param include_search: whether search should be included for this category
-        @type include_search: L{bool}
-        @return: the number of items added to the render result
-        @rtype: L{int}
-        """
-        page = template.render(
-            to_root="../../..",
-            title="{} fanfiction on {} - Page {}".format(category.name, category.publisher.name, page_index),
-            category=category,
+            stories = sorted(category.stories, key=operator.attrgetter("score", "total_words"), reverse=True)
+        publisher_name = category.publisher.name
+        return self._render_story_list(
+            base_path="category/{}/{}/".format(publisher_name, normalize_tag(category.name)),
+            title_prefix="{} fanfiction on {}".format(category.name, publisher_name),
+            redirect_title="Category: {} on {}".format(category.name, publisher_name),
             stories=stories,
-            include_search=(include_search and (page_index == 1 or not SEARCH_ONLY_ON_FIRST_PAGE)),
-            num_pages=num_pages,
-            cur_page=page_index,
-        )
-        result.add(
-            HtmlPage(
-                path="category/{}/{}/{}".format(category.publisher.name, normalize_tag(category.name), page_index),
-                content=self.minify_html(page),
-                title="{} fanfiction on {} - Page {}".format(category.name, category.publisher.name, page_index),
-                is_front=False,
-            ),
+            num_stories=num_stories,
+            statistics=statistics,
+            search_metadata=search_metadata,
         )
-        return 1  # 1 item added
-
 
     def render_series(self, series):
         """
@@ -815,26 +1055,28 @@ class HtmlRenderer(object):
         @rtype: L{RenderResult}
         """
         result = RenderResult()
-        series_template = self.environment.get_template("series.html.jinja")
-        stats = StoryListStatCreator.get_stats_from_iterable(series.stories)
+        publisher_name = series.publisher.name
+        base_path = "series/{}/{}/".format(publisher_name, normalize_tag(series.name))
+        series_template = self._series_template
+        statistics = StoryListStatCreator.get_stats_from_iterable(series.stories)
         page = series_template.render(
             to_root="../../..",
             series=series,
-            stats=stats,
+            stats=statistics,
         )
         result.add(
             HtmlPage(
-                path="series/{}/{}/".format(series.publisher.name, normalize_tag(series.name)),
+                path=base_path,
                 content=self.minify_html(page),
-                title="Series: '{}' on {}".format(series.name, series.publisher.name),
+                title="Series: '{}' on {}".format(series.name, publisher_name),
                 is_front=True,
             ),
         )
         result.add(
             JsonObject(
-                path="series/{}/{}/storyupdates.json".format(series.publisher.name, normalize_tag(series.name)),
+                path=base_path + "storyupdates.json",
                 title="",
-                content=stats.timeline,
+                content=statistics.timeline,
             )
         )
         return result
@@ -855,8 +1097,6 @@ class HtmlRenderer(object):
         @return: the rendered pages and redirects
         @rtype: L{RenderResult}
         """
-        if stories is None:
-            stories = publisher.stories
         # NOTE: also not keeping track of items in result here
         # -> items in publisher depend on number of categories, which
         #    individually should not take enough RAM to cause memory
@@ -866,10 +1106,12 @@ class HtmlRenderer(object):
         # which the category is not implied. This is quite ugly, we
         # should replace this behavior in the future
         result = RenderResult()
-        publisher_template = self.environment.get_template("publisher.html.jinja")
+        publisher_template = self._publisher_template
         include_stats = True
         collect_stats = (statistics is None) and include_stats
         if collect_stats:
+            if stories is None:
+                stories = publisher.stories
             statistics = StoryListStatCreator.get_stats_from_iterable(stories)
         page = publisher_template.render(
             to_root="../..",
@@ -894,15 +1136,14 @@ class HtmlRenderer(object):
                 )
             )
         # category pages
-        bucketmaker = BucketMaker(CATEGORIES_PER_PAGE)
-        categories = []
-        for category in sorted(publisher.categories, key=lambda c: c.name):
-            bucket = bucketmaker.feed(category)
-            if bucket is not None:
-                categories.append(bucket)
-        bucket = bucketmaker.finish()
-        if bucket is not None:
-            categories.append(bucket)
+        # the categories are usually already loaded ordered by name, in
+        # which case sorting them is merely a linear check. It is kept
+        # as database collations may order names differently.
+        sorted_categories = sorted(publisher.categories, key=operator.attrgetter("name"))
+        categories = [
+            sorted_categories[i:i + CATEGORIES_PER_PAGE]
+            for i in range(0, len(sorted_categories), CATEGORIES_PER_PAGE)
+        ]
         # find first letter of first category on each page
         startletters = [cl[0].name[0] for cl in categories]
         # find first page each letter occurs on
@@ -915,22 +1156,24 @@ class HtmlRenderer(object):
                     seen_startletters.append(start_letter)
                     startletters_first_occurrences.append((start_letter, pagenum))
         # render category pages
-        category_page_template = self.environment.get_template("category_long_list_page.html.jinja")
+        category_page_template = self._category_page_template
+        minify = self.minify_html
         for i, categorylist in enumerate(categories, start=1):
-            page = category_page_template.render(
-                to_root="../../..",
-                publisher=publisher,
-                categories=categorylist,
-                startletters=startletters,
-                startletters_first_occurrences=startletters_first_occurrences,
-                title="Categories - Page {} of {}".format(i, len(categories)),
-                cur_page=i,
-                num_pages=len(categories),
-            )
             result.add(
                 HtmlPage(
                     path="publisher/{}/categories/{}".format(publisher.name, i),
-                    content=self.minify_html(page),
+                    content=minify(
+                        category_page_template.render(
+                            to_root="../../..",
+                            publisher=publisher,
+                            categories=categorylist,
+                            startletters=startletters,
+                            startletters_first_occurrences=startletters_first_occurrences,
+                            title="Categories - Page {} of {}".format(i, len(categories)),
+                            cur_page=i,
+                            num_pages=len(categories),
+                        ),
+                    ),
                     title="Categories: {} - Page {}".format(publisher.name, i),
                     is_front=False,
                 ),
@@ -947,7 +1190,7 @@ class HtmlRenderer(object):
         @rtype: L{RenderResult}
         """
         result = RenderResult()
-        index_template = self.environment.get_template("index.html.jinja")
+        index_template = self._index_template
         page = index_template.render(
             to_root=".",
             publishers=publishers,
@@ -973,7 +1216,7 @@ class HtmlRenderer(object):
         @rtype: L{RenderResult}
         """
         result = RenderResult()
-        stats_template = self.environment.get_template("storyliststatspage.html.jinja")
+        stats_template = self._stats_page_template
         page = stats_template.render(
             to_root=".",
             title="Global Statistics",
@@ -1058,7 +1301,7 @@ class HtmlRenderer(object):
         """
         result = RenderResult()
         # general info page
-        info_template = self.environment.get_template("info.html.jinja")
+        info_template = self._info_template
         info_page = info_template.render(
             to_root="..",
         )
@@ -1079,7 +1322,7 @@ class HtmlRenderer(object):
             ),
         )
         # acknowledgements
-        ack_template = self.environment.get_template("acknowledgements.html.jinja")
+        ack_template = self._acknowledgements_template
         licenses = {}
         with open(get_resource_file_path("chartjs", "LICENSE.md")) as fin:
             licenses["chart.js"] = fin.read()
@@ -1103,23 +1346,41 @@ class HtmlRenderer(object):
         """
         Render a storytext, returning the rendered html.
 
+        If a storytext cache directory has been specified in the render
+        options, the rendered html is cached there by the hash of the
+        story text, so unchanged chapters do not need to be rendered
+        again in later builds.
+
         @param value: story text to render
         @type value: L{str}
         @return: the rendered HTML of the story text
         @rtype: L{str}
         """
-        return mistune.html(value)
-
-    def _normalize_tag(self, value):
+        if self.options.storytext_cache_directory is None:
+            return self._render_storytext(value)
+        # the cache is retrieved for each call, as the renderer may be
+        # shared with forked processes
+        cache = _get_storytext_cache(self.options.storytext_cache_directory)
+        key = self._storytext_cache_key_prefix + hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        rendered = self._render_storytext(value)
+        cache.put(key, rendered)
+        return rendered
+
+    def _render_storytext(self, value):
         """
-        Like L{zimfiction.util.normalize_tag}, but also quote the value
+        Render a storytext using the best available markdown renderer.
 
-        @param value: tag name to normalize
+        @param value: story text to render
         @type value: L{str}
-        @return: the normalized, encoded tag
+        @return: the rendered HTML of the story text
         @rtype: L{str}
         """
-        return urllib.parse.quote_plus(normalize_tag(value))
+        if len(value) <= SHORT_STORYTEXT_LENGTH:
+            return _render_short_markdown(value)
+        return _render_markdown(value)
 
     def _format_date(self, value):
         """
@@ -1130,7 +1391,7 @@ class HtmlRenderer(object):
         @return: the formated date
         @rtype: L{str}
         """
-        return value.strftime("%Y-%m-%d")
+        return format_date(value)
 
     def _first_elements(self, value, n):
         """
@@ -1,9 +1,17 @@
 """
 This module contains functionality to create the search metadata.
 """
-import math
+import json
+import tempfile
 
-from .buckets import BucketMaker
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# serialized search items beyond this size are moved to disk
+MAX_IN_MEMORY_SEARCH_SIZE = 16 * 1024 * 1024
 
 
 class SearchMetadataCreator(object):
@@ -22,6 +30,23 @@ class SearchMetadataCreator(object):
         "characters", "implied_characters",
         "rating",
     )
+    # (field name, field of the tag ids, whether the tags are implied, whether it is a single tag)
+    _FIELD_RESOLUTION = (
+        ("publisher", "publisher", False, True),
+        ("language", "language", False, True),
+        ("status", "status", False, True),
+        ("categories", "categories", False, False),
+        ("implied_categories", "categories", True, False),
+        ("warnings", "warnings", False, False),
+        ("implied_warnings", "warnings", True, False),
+        ("tags", "tags", False, False),
+        ("implied_tags", "tags", True, False),
+        ("relationships", "relationships", False, False),
+        ("implied_relationships", "relationships", True, False),
+        ("characters", "characters", False, False),
+        ("implied_characters", "characters", True, False),
+        ("rating", "rating", False, True),
+    )
 
     def __init__(self, max_page_size=50000):
         """
@@ -35,7 +60,9 @@ class SearchMetadataCreator(object):
         self._cur_tag_id = 0
         self._tag_ids = {f: {} for f in self._SEARCH_FIELDS if not f.startswith("implied_")}  # field -> {tag -> id}
         self._amounts = {}  # for RAM optimization purposes, only store amounts > 1
-        self._search_items = []
+        # the serialized search items, separated by commas within a page
+        self._search_file = tempfile.SpooledTemporaryFile(max_size=MAX_IN_MEMORY_SEARCH_SIZE)
+        self._page_offsets = []  # offset of the first item of each page in the search file
 
     def feed(self, story):
         """
@@ -44,10 +71,10 @@ class SearchMetadataCreator(object):
         @param story: story to process
         @type story: L{zimfiction.db.models.Story}
         """
-        # the following code is the result of merging three other
-        # methods. It is quite suboptimal, aesthetically speaking. I am sorry.
         self._num_stories += 1
         searchmeta = story.get_search_data()
+        tags = []
+        implied_tags = []
         itemdata = {
             "publisher": searchmeta["publisher"],
             "id": searchmeta["id"],
@@ -56,51 +83,52 @@ class SearchMetadataCreator(object):
             "words":  searchmeta["words"],
             "chapters": searchmeta["chapters"],
             "score": searchmeta["score"],
-            "tags": [],
-            "implied_tags": [],
+            "tags": tags,
+            "implied_tags": implied_tags,
             # "rating": searchmeta["rating"],
             "category_count": searchmeta["category_count"],
         }
-        # find new tag ids
-        for fieldname in self._SEARCH_FIELDS:
-            outkey = fieldname.replace("implied_", "")
-            tags = searchmeta[fieldname]
-            if not isinstance(tags, (list, tuple)):
+        all_tag_ids = self._tag_ids
+        amounts = self._amounts
+        # resolve the tag ids and store them in a single pass
+        for fieldname, id_field, is_implied, is_single_tag in self._FIELD_RESOLUTION:
+            field_tags = searchmeta[fieldname]
+            if is_single_tag:
                 # for ease of processing, convert single tags
-                # into a list
-                tags = [tags]
-            for tag in tags:
-                if tag not in self._tag_ids[outkey]:
-                    tag_id = self._cur_tag_id
+                # into a tuple
+                field_tags = (field_tags, )
+            tag_ids = all_tag_ids[id_field]
+            out = (implied_tags if is_implied else tags)
+            for tag in field_tags:
+                # a single lookup both finds and registers the tag id
+                prev_len = len(tag_ids)
+                tag_id = tag_ids.setdefault(tag, self._cur_tag_id)
+                if len(tag_ids) != prev_len:
+                    # new tag
                     self._cur_tag_id += 1
-                    self._tag_ids[outkey][tag] = tag_id
                     # do not yet register tag in amounts
                     # we try to save some RAM by assuming that every
                     # tag in self._tag_ids and not in self._amounts
                     # occurs exactly once
                 else:
-                    tag_id = self._tag_ids[outkey][tag]
-                    if tag_id not in self._amounts:
-                        self._amounts[tag_id] = 2
-                    else:
-                        self._amounts[tag_id] += 1
-            # store search tags of story
-            outkey = "tags"
-            resolve_field = fieldname
-            if fieldname.startswith("implied_"):
-                outkey = "implied_tags"
-                resolve_field = resolve_field.replace("implied_", "")
-            if isinstance(searchmeta[fieldname], (list, tuple)):
-                for tag in searchmeta[fieldname]:
-                    resolved_tag = self._tag_ids[resolve_field][tag]
-                    itemdata[outkey].append(resolved_tag)
-            else:
-                # non-list tag
-                resolved_tag = self._tag_ids[resolve_field][searchmeta[fieldname]]
-                itemdata[outkey].append(resolved_tag)
-        itemdata["tags"].sort()
-        itemdata["implied_tags"].sort()
-        self._search_items.append(itemdata)
+                    amounts[tag_id] = amounts.get(tag_id, 1) + 1
+                out.append(tag_id)
+        tags.sort()
+        implied_tags.sort()
+        # the items are serialized immediately, as the encoded json is
+        # far more compact than the dicts and lists describing it. For
+        # large story lists, it is moved to disk.
+        if orjson is None:
+            serialized = json.dumps(itemdata, separators=(",", ":")).encode("utf-8")
+        else:
+            serialized = orjson.dumps(itemdata)
+        # split the search items into pages right away
+        search_file = self._search_file
+        if (self._num_stories - 1) % self._max_page_size == 0:
+            self._page_offsets.append(search_file.tell())
+        else:
+            search_file.write(b",")
+        search_file.write(serialized)
 
     def get_search_header(self):
         """
@@ -110,26 +138,30 @@ class SearchMetadataCreator(object):
         @rtype: L{dict}
         """
         header = {}
-        header["num_pages"] = math.ceil(self._num_stories / self._max_page_size)
+        header["num_pages"] = -(-self._num_stories // self._max_page_size)  # ceil division
         header["tag_ids"] = self._tag_ids
-        header["amounts"] = {tag_id: self._amounts.get(tag_id, 1) for tag_id_group in self._tag_ids.values() for tag_name, tag_id in tag_id_group.items()}
+        # tags without an entry in self._amounts occur exactly once
+        amounts = dict.fromkeys((tag_id for tag_id_group in self._tag_ids.values() for tag_id in tag_id_group.values()), 1)
+        amounts.update(self._amounts)
+        header["amounts"] = amounts
         return header
 
     def iter_search_pages(self):
         """
         Iterate over the search pages.
 
+        The content of each page is the already serialized json array
+        of the search items on it. The search items are released once
+        all pages have been yielded. Consequently, this method can only
+        be used once.
+
         @yields: (pagenum, content)
-        @ytype: L{tuple} of (L{int}, L{dict})
+        @ytype: L{tuple} of (L{int}, L{bytes})
         """
-        bucketmaker = BucketMaker(maxsize=self._max_page_size)
-        cur_file_i = 0
-        for item in self._search_items:
-            bucket = bucketmaker.feed(item)
-            if bucket is not None:
-                yield (cur_file_i, bucket)
-                cur_file_i += 1
-        bucket = bucketmaker.finish()
-        if bucket is not None:
-            yield (cur_file_i, bucket)
+        search_file = self._search_file
+        offsets = self._page_offsets + [search_file.tell()]
+        search_file.seek(0)
+        for i in range(len(self._page_offsets)):
+            yield (i, b"[" + search_file.read(offsets[i + 1] - offsets[i]) + b"]")
+        search_file.close()
 
@@ -15,6 +15,8 @@ take the results and add them to the creator.
 @type MAX_STORY_EAGERLOAD: L{int}
 @var MIN_STORIES_FOR_EXPLICIT_STATS: when rendering tags and stories, collect stats per SQL if we have at least this number of stories
 @type MIN_STORIES_FOR_EXPLICIT_STATS: L{int}
+@var MIN_STORIES_FOR_STREAM: when rendering tags and categories, stream the stories from the database if we have at least this number of stories
+@type MIN_STORIES_FOR_STREAM: L{int}
 @var STORY_LIST_YIELD: number of story to fetch at once when rendering tags, categories, ...
 @type STORY_LIST_YIELD: L{int}
 """
@@ -23,7 +25,7 @@ import os
 import time
 
 from sqlalchemy import select, and_, func, desc, literal_column
-from sqlalchemy.orm import Session, joinedload, subqueryload, selectinload, raiseload, undefer, noload, contains_eager
+from sqlalchemy.orm import Session, joinedload, selectinload, raiseload, undefer, noload, contains_eager
 
 try:
     import memray
@@ -44,9 +46,10 @@ MARKER_TASK_COMPLETED = "completed"
 
 MAX_STORY_EAGERLOAD = 10000
 MIN_STORIES_FOR_EXPLICIT_STATS = 10000
-MIN_STORIES_FOR_STREAM = 10000
-
 STORY_LIST_YIELD = 2000
+# anything larger than a single batch is streamed, so that at most one
+# batch of stories is loaded at any time
+MIN_STORIES_FOR_STREAM = STORY_LIST_YIELD
 
 
 class Task(object):
@@ -116,18 +119,24 @@ class TagRenderTask(Task):
 
     @ivar uid: uid of tag to render
     @type uid: L{int}
+    @ivar n_stories: number of non-implied stories in the tag, if known
+    @type n_stories: L{int} or L{None}
     """
     type = "tag"
 
-    def __init__(self, uid):
+    def __init__(self, uid, n_stories=None):
         """
         The default constructor.
 
         @param uid: uid of tag to render
         @type uid: L{int}
+        @param n_stories: number of non-implied stories in the tag, if known
+        @type n_stories: L{int} or L{None}
         """
         assert isinstance(uid, int)
+        assert isinstance(n_stories, int) or (n_stories is None)
         self.uid = uid
+        self.n_stories = n_stories
 
     @property
     def name(self):
@@ -164,18 +173,24 @@ class CategoryRenderTask(Task):
 
     @ivar uid: uid of category to render
     @type uid: L{int}
+    @ivar n_stories: number of non-implied stories in the category, if known
+    @type n_stories: L{int} or L{None}
     """
     type = "category"
 
-    def __init__(self, uid):
+    def __init__(self, uid, n_stories=None):
         """
         The default constructor.
 
         @param uid: uid of category to render
         @type uid: L{int}
+        @param n_stories: number of non-implied stories in the category, if known
+        @type n_stories: L{int} or L{None}
         """
         assert isinstance(uid, int)
+        assert isinstance(n_stories, int) or (n_stories is None)
         self.uid = uid
+        self.n_stories = n_stories
 
     @property
     def name(self):
@@ -307,8 +322,10 @@ class Worker(object):
     @type _log_file: file-like object
     @ivar _last_log_time: timestamp of last log entry
     @ivar _last_log_time: L{int}
+    @ivar _task_handlers: a dict mapping task types to the methods processing them
+    @type _task_handlers: L{dict} of L{str} -> callable
     """
-    def __init__(self, id, inqueue, outqueue, engine, options, render_options):
+    def __init__(self, id, inqueue, outqueue, engine, options, render_options, renderer=None):
         """
         The default constructor.
 
@@ -324,6 +341,8 @@ class Worker(object):
         @type options: L{WorkerOptions}
         @param render_options: options for the renderer
         @type render_options: L{zimfiction.zimbuild.renderer.RenderOptions}
+        @param renderer: if specified, use this (shared) renderer instead of creating a new one
+        @type renderer: L{zimfiction.zimbuild.renderer.HtmlRenderer} or L{None}
         """
         assert isinstance(id, int)
         self.id = id
@@ -333,7 +352,22 @@ class Worker(object):
 
         self.session = Session(engine)
         self.options = options
-        self.renderer = HtmlRenderer(options=render_options)
+        if renderer is None:
+            self.renderer = HtmlRenderer(options=render_options)
+            # compile all templates now rather than during the first tasks
+            self.renderer.preload_templates()
+        else:
+            self.renderer = renderer
+
+        self._task_handlers = {
+            "story": self.process_story_task,
+            "tag": self.process_tag_task,
+            "author": self.process_author_task,
+            "category": self.process_category_task,
+            "series": self.process_series_task,
+            "publisher": self.process_publisher_task,
+            "etc": self.process_etc_task,
+        }
 
         self.setup_logging()
 
@@ -396,23 +430,14 @@ class Worker(object):
                     self.log("Stopping worker...")
                     running = False
                     self._cleanup()
-                elif task.type == "story":
-                    self.process_story_task(task)
-                elif task.type == "tag":
-                    self.process_tag_task(task)
-                elif task.type == "author":
-                    self.process_author_task(task)
-                elif task.type == "category":
-                    self.process_category_task(task)
-                elif task.type == "series":
-                    self.process_series_task(task)
-                elif task.type == "publisher":
-                    self.process_publisher_task(task)
-                elif task.type == "etc":
-                    self.process_etc_task(task)
                 else:
-                    raise ValueError("Task {} has an unknown task type '{}'!".format(repr(task), task.type))
-                if task.type != "stop":
+                    handler = self._task_handlers.get(task.type, None)
+                    if handler is None:
+                        raise ValueError("Task {} has an unknown task type '{}'!".format(repr(task), task.type))
+                    handler(task)
+                    # release the objects loaded for this task, otherwise
+                    # the identity map keeps them alive for the next ones
+                    self.session.expunge_all()
                     # notify builder that a task was completed
                     self.log("Marking task as completed.")
                     self.outqueue.put(MARKER_TASK_COMPLETED)
@@ -426,6 +451,7 @@ class Worker(object):
 
         All cleanup (e.g. closing sessions) should happen here.
         """
+        self.renderer.flush_storytext_cache()
         self.session.close()
         self.engine.dispose()
 
@@ -497,17 +523,19 @@ class Worker(object):
                 undefer(Story.summary),
                 selectinload(Story.chapters).undefer(Chapter.text),
             )
-        for story_uid in task.story_uids:
-            # get the story
-            self.log("Retrieving story...")
-            story = self.session.scalars(
-                select(Story)
-                .where(Story.uid == story_uid)
-                .options(
-                    *options,
-                )
-            ).first()
-            self.log("Retrieved story, rendering...")
+        # get all stories of this task at once, so that the relationships
+        # are loaded for all stories with a single query each
+        self.log("Retrieving stories...")
+        stories = self.session.scalars(
+            select(Story)
+            .where(Story.uid.in_(task.story_uids))
+            .options(
+                *options,
+            )
+        ).all()
+        self.log("Retrieved {} stories.".format(len(stories)))
+        for story in stories:
+            self.log("Rendering story...")
             result = self.renderer.render_story(story)
             self.log("Rendered story, submitting result...")
             self.handle_result(result)
@@ -520,16 +548,42 @@ class Worker(object):
         @param task: task to process
         @type task: L{TagRenderTask}
         """
-        # count stories in tag
-        self.log("Counting non-implied stories in tag...")
-        count_stmt = (
-            select(func.count(StoryTagAssociation.story_uid))
+        # load the tag first. This is cheap and lets us skip all other
+        # queries if the tag does not exist.
+        self.log("Loading tag...")
+        tag_stmt = (
+            select(Tag)
             .where(
-                StoryTagAssociation.tag_uid == task.uid,
-                StoryTagAssociation.implication_level <= ImplicationLevel.MAX_LIST_INCLUDE,
+                Tag.uid == task.uid,
+            )
+            .options(
+                raiseload(Tag.story_associations),
             )
         )
-        n_stories_in_tag = self.session.execute(count_stmt).scalar_one()
+        tag = self.session.scalars(tag_stmt).first()
+        self.log("Tag loaded.")
+        if tag is None:
+            self.log("-> Tag not found!")
+            self.log("Submitting empty result...")
+            result = RenderResult()
+            self.handle_result(result)
+            self.log("Done.")
+            return
+        self.session.expunge(tag)  # prevent tag from being modified and storing objects
+
+        # count stories in tag
+        if task.n_stories is not None:
+            n_stories_in_tag = task.n_stories
+        else:
+            self.log("Counting non-implied stories in tag...")
+            count_stmt = (
+                select(func.count(StoryTagAssociation.story_uid))
+                .where(
+                    StoryTagAssociation.tag_uid == task.uid,
+                    StoryTagAssociation.implication_level <= ImplicationLevel.MAX_LIST_INCLUDE,
+                )
+            )
+            n_stories_in_tag = self.session.execute(count_stmt).scalar_one()
         self.log("Found {} stories.".format(n_stories_in_tag))
         # collect statistics
         if n_stories_in_tag >= MIN_STORIES_FOR_EXPLICIT_STATS:
@@ -548,33 +602,12 @@ class Worker(object):
             )
         else:
             statistics = None
-        # load tag
-        self.log("Loading tag...")
-        tag_stmt = (
-            select(Tag)
-            .where(
-                Tag.uid == task.uid,
-            )
-            .options(
-                raiseload(Tag.story_associations),
-            )
-        )
-        tag = self.session.scalars(tag_stmt).first()
-        self.session.expunge(tag)  # prevent tag from being modified and storing objects
-        self.log("Tag loaded.")
-        if tag is None:
-            self.log("-> Tag not found!")
-            self.log("Submitting empty result...")
-            result = RenderResult()
-            self.handle_result(result)
-            self.log("Done.")
-            return
-
         # load non-implied stories
         self.log("Starting to load stories...")
         # always use eager loading, lazy is horrible for performance here
         options = (
-            selectinload(Story.chapters),
+            # story lists only need the chapter count and word counts
+            selectinload(Story.chapters).load_only(Chapter.num_words),
             joinedload(Story.author),
             selectinload(Story.series_associations),
             joinedload(Story.series_associations, StorySeriesAssociation.series),
@@ -612,7 +645,11 @@ class Worker(object):
                     StoryTagAssociation,
                     StoryTagAssociation.story_uid == Chapter.story_uid,
                 )
-                .where(StoryTagAssociation.tag_uid == task.uid)
+                .where(
+                    StoryTagAssociation.tag_uid == task.uid,
+                    # only count the chapters of listed stories
+                    StoryTagAssociation.implication_level <= ImplicationLevel.MAX_LIST_INCLUDE,
+                )
                 .group_by("chapter_story_uid").subquery(),
                 Story.uid == literal_column("chapter_story_uid"),
             )
@@ -653,11 +690,29 @@ class Worker(object):
         author = self.session.scalars(
             select(Author)
             .where(Author.uid == task.uid)
+        ).first()
+        self.log("Retrieving stories...")
+        stories = self.session.scalars(
+            select(Story)
+            .where(Story.author_uid == task.uid)
+            .order_by(desc(Story.published), Story.uid)
             .options(
-                # eager loading options
-                joinedload(Author.stories).undefer(Story.summary),
+                undefer(Story.summary),
+                # the summaries need these relationships, load them
+                # for all stories at once rather than per story
+                # story lists only need the chapter count and word counts
+                selectinload(Story.chapters).load_only(Chapter.num_words),
+                selectinload(Story.series_associations),
+                joinedload(Story.series_associations, StorySeriesAssociation.series),
+                noload(Story.series_associations, StorySeriesAssociation.series, Series.story_associations),
+                selectinload(Story.tag_associations),
+                joinedload(Story.tag_associations, StoryTagAssociation.tag),
+                noload(Story.tag_associations, StoryTagAssociation.tag, Tag.story_associations),
+                selectinload(Story.category_associations),
+                joinedload(Story.category_associations, StoryCategoryAssociation.category),
+                noload(Story.category_associations, StoryCategoryAssociation.category, Category.story_associations),
             )
-        ).first()
+        ).all()
         self.log("Finding author activity on other publishers...")
         other_identities = self.session.scalars(
             select(Author)
@@ -672,7 +727,7 @@ class Worker(object):
             )
         ).all()
         self.log("Rendering author...")
-        result = self.renderer.render_author(author, other_identities=other_identities)
+        result = self.renderer.render_author(author, other_identities=other_identities, stories=stories)
         self.log("Submitting result...")
         self.handle_result(result)
         self.log("Done.")
@@ -684,33 +739,8 @@ class Worker(object):
         @param task: task to process
         @type task: L{CategoryRenderTask}
         """
-        # count stories in category
-        self.log("Counting non-implied stories in category...")
-        count_stmt = (
-            select(func.count(StoryCategoryAssociation.story_uid))
-            .where(
-                StoryCategoryAssociation.category_uid == task.uid,
-                StoryCategoryAssociation.implication_level <= ImplicationLevel.MAX_LIST_INCLUDE,
-            )
-        )
-        n_stories_in_category = self.session.execute(count_stmt).scalar_one()
-        self.log("Found {} stories.".format(n_stories_in_category))
-        # collect statistics
-        if n_stories_in_category >= MIN_STORIES_FOR_EXPLICIT_STATS:
-            self.log("Collecting statistics...")
-            statistics = query_story_list_stats(
-                self.session,
-                (
-                    select(StoryCategoryAssociation.story_uid)
-                    .where(
-                        StoryCategoryAssociation.category_uid == task.uid,
-                        StoryCategoryAssociation.implication_level <= ImplicationLevel.MAX_LIST_INCLUDE,
-                    )
-                ),
-            )
-        else:
-            statistics = None
-        # load category
+        # load the category first. This is cheap and lets us skip all other
+        # queries if the category does not exist.
         self.log("Loading category...")
         category_stmt = (
             select(Category)
@@ -731,6 +761,35 @@ class Worker(object):
             self.log("Done.")
             return
 
+        # count stories in category
+        if task.n_stories is not None:
+            n_stories_in_category = task.n_stories
+        else:
+            self.log("Counting non-implied stories in category...")
+            count_stmt = (
+                select(func.count(StoryCategoryAssociation.story_uid))
+                .where(
+                    StoryCategoryAssociation.category_uid == task.uid,
+                    StoryCategoryAssociation.implication_level <= ImplicationLevel.MAX_LIST_INCLUDE,
+                )
+            )
+            n_stories_in_category = self.session.execute(count_stmt).scalar_one()
+        self.log("Found {} stories.".format(n_stories_in_category))
+        # collect statistics
+        if n_stories_in_category >= MIN_STORIES_FOR_EXPLICIT_STATS:
+            self.log("Collecting statistics...")
+            statistics = query_story_list_stats(
+                self.session,
+                (
+                    select(StoryCategoryAssociation.story_uid)
+                    .where(
+                        StoryCategoryAssociation.category_uid == task.uid,
+                        StoryCategoryAssociation.implication_level <= ImplicationLevel.MAX_LIST_INCLUDE,
+                    )
+                ),
+            )
+        else:
+            statistics = None
         # load non-implied stories
         self.log("Starting to load stories...")
         execution_options = {}
@@ -756,7 +815,11 @@ class Worker(object):
                     StoryCategoryAssociation,
                     StoryCategoryAssociation.story_uid == Chapter.story_uid,
                 )
-                .where(StoryCategoryAssociation.category_uid == task.uid)
+                .where(
+                    StoryCategoryAssociation.category_uid == task.uid,
+                    # only count the chapters of listed stories
+                    StoryCategoryAssociation.implication_level <= ImplicationLevel.MAX_LIST_INCLUDE,
+                )
                 .group_by("chapter_story_uid").subquery(),
                 Story.uid == literal_column("chapter_story_uid"),
             )
@@ -767,7 +830,8 @@ class Worker(object):
             )
             .options(
                 undefer(Story.summary),
-                selectinload(Story.chapters),
+                # story lists only need the chapter count and word counts
+                selectinload(Story.chapters).load_only(Chapter.num_words),
                 joinedload(Story.author),
                 selectinload(Story.series_associations),
                 joinedload(Story.series_associations, StorySeriesAssociation.series),
@@ -810,10 +874,27 @@ class Worker(object):
             .where(Series.uid == task.uid)
             .options(
                 # eager loading options
-                joinedload(Series.story_associations),
-                joinedload(Series.story_associations, StorySeriesAssociation.story).undefer(Story.summary),
+                # use selectinload for the stories, so that the series
+                # is not repeated for every story (and its summary)
+                selectinload(Series.story_associations),
+                selectinload(Series.story_associations, StorySeriesAssociation.story)
+                .undefer(Story.summary)
+                .options(
+                    # story lists only need the chapter count and word counts
+                    selectinload(Story.chapters).load_only(Chapter.num_words),
+                    selectinload(Story.series_associations),
+                    joinedload(Story.series_associations, StorySeriesAssociation.series),
+                    selectinload(Story.tag_associations),
+                    joinedload(Story.tag_associations, StoryTagAssociation.tag),
+                    noload(Story.tag_associations, StoryTagAssociation.tag, Tag.story_associations),
+                    selectinload(Story.category_associations),
+                    joinedload(Story.category_associations, StoryCategoryAssociation.category),
+                    noload(Story.category_associations, StoryCategoryAssociation.category, Category.story_associations),
+                ),
             )
         ).first()
+        # the statistics are collected by the renderer from the eagerly
+        # loaded stories, chapters and tags, without further queries
         self.log("Rendering series...")
         result = self.renderer.render_series(series)
         self.log("Submitting result...")
@@ -854,8 +935,13 @@ class Worker(object):
                 # eager loading options
                 # joinedload(Publisher.categories, Category.story_associations),
                 # joinedload(Publisher.categories, Category.story_associations, StoryCategoryAssociation.story),
-                contains_eager(Publisher.categories),
+                # the story counts of the categories need their story
+                # associations, load them in batches rather than lazily
+                # with one query per category
+                contains_eager(Publisher.categories).selectinload(Category.story_associations),
             )
+            # load the categories in the order they are listed in
+            .order_by(Category.name)
         ).first()
         # collect statistics
         # TODO: make the stats only include non-implied stories
@@ -867,18 +953,9 @@ class Worker(object):
                 .where(Story.publisher_uid == task.uid)
             ),
         )
-        self.log("Starting to fetch stories in publisher...")
-        stories = self.session.scalars(
-            select(Story)
-            .where(Story.publisher_uid == task.uid)
-            .execution_options(
-                yield_per=STORY_LIST_YIELD,
-            )
-        )
         self.log("Rendering publisher...")
         result = self.renderer.render_publisher(
             publisher=publisher,
-            stories=stories,
             statistics=statistics,
         )
         self.log("Submitting result...")
@@ -899,7 +976,7 @@ class Worker(object):
                 select(Publisher)
                 .options(
                     # eager loading options
-                    subqueryload(Publisher.categories),
+                    selectinload(Publisher.categories),
                     # joinedload(Publisher.categories, Category.stories),
                     raiseload(Publisher.categories, Category.story_associations),
                 )